@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import time
+from pseudocode_interpreter import PseudocodeInterpreter, ScriptedInputProvider, ExecutionLimitExceeded
+
+# Per-case limits so one runaway submission can't hang the whole batch
+DEFAULT_MAX_STEPS = 1_000_000
+DEFAULT_TIME_LIMIT = 10.0
+
+# Program shared with worker processes. With the fork start method it is set
+# before the pool starts, so workers inherit it copy-on-write instead of
+# receiving a pickled copy with every task.
+_program = None
+_limits = {}
+
+def _set_program(program, limits=None):
+    global _program, _limits
+    _program = program
+    _limits = limits or {}
+
+def _run_case(job):
+    index, case = job
+    interpreter = PseudocodeInterpreter(
+        input_provider=ScriptedInputProvider(case.get('inputs', [])),
+        memoize=case.get('memoize', True),
+        max_steps=case.get('max_steps', _limits.get('max_steps')),
+        time_limit=case.get('time_limit', _limits.get('time_limit')),
+        record_steps=False
+    )
+    limit_exceeded = False
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        output = interpreter.interpret(_program)
+        error = interpreter.error
+    except ExecutionLimitExceeded as e:
+        output = '\n'.join(e.output)
+        error = str(e)
+        limit_exceeded = True
+    except Exception as e:
+        output = '\n'.join(interpreter.output)
+        error = str(e)
+    duration = time.perf_counter() - start
+    cpu_time = time.process_time() - cpu_start
+
+    passed = None
+    if 'expected_output' in case:
+        passed = error is None and output.strip() == str(case['expected_output']).strip()
+
+    return {
+        'index': index,
+        'output': output,
+        'error': error,
+        'passed': passed,
+        'limit_exceeded': limit_exceeded,
+        'steps': interpreter.steps_taken,
+        'duration': duration,
+        'cpu_time': cpu_time,
+        'worker': os.getpid()
+    }
+
+def run_test_cases(pseudocode, test_cases, processes=None, chunksize=None,
+                   max_steps=DEFAULT_MAX_STEPS, time_limit=DEFAULT_TIME_LIMIT):
+    """Run one program against many test cases across all cores.
+
+    Each test case is a dict with optional 'inputs' (values for INPUT
+    statements, in order), 'expected_output', 'memoize', and 'max_steps' /
+    'time_limit' overriding the batch limits. A case that goes over a limit is
+    stopped and reported as an error. Results come back in the same order as
+    test_cases, whatever worker ran them.
+    """
+    test_cases = list(test_cases)
+    processes = processes or os.cpu_count() or 1
+    processes = max(1, min(processes, len(test_cases)))
+    if chunksize is None:
+        chunksize = max(1, len(test_cases) // (processes * 4))
+
+    limits = {'max_steps': max_steps, 'time_limit': time_limit}
+    start = time.perf_counter()
+    jobs = list(enumerate(test_cases))
+    try:
+        if processes == 1:
+            _set_program(pseudocode, limits)
+            results = [_run_case(job) for job in jobs]
+        else:
+            # Only rely on fork where it is the platform default; elsewhere (e.g.
+            # macOS) forking a threaded process such as the Flask server is unsafe
+            if multiprocessing.get_start_method() == 'fork':
+                _set_program(pseudocode, limits)
+                pool = multiprocessing.get_context('fork').Pool(processes)
+            else:
+                pool = multiprocessing.get_context('spawn').Pool(
+                    processes, initializer=_set_program, initargs=(pseudocode, limits))
+            with pool:
+                results = pool.map(_run_case, jobs, chunksize)
+    finally:
+        _set_program(None)
+    wall_time = time.perf_counter() - start
+
+    durations = [r['duration'] for r in results]
+    graded = [r for r in results if r['passed'] is not None]
+    stats = {
+        'cases': len(results),
+        'passed': sum(1 for r in graded if r['passed']),
+        'failed': sum(1 for r in graded if not r['passed']),
+        'errors': sum(1 for r in results if r['error'] is not None),
+        'limit_exceeded': sum(1 for r in results if r['limit_exceeded']),
+        'processes': processes,
+        'wall_time': wall_time,
+        'cpu_time': sum(r['cpu_time'] for r in results),
+        'throughput': len(results) / wall_time if wall_time > 0 else 0.0,
+        'mean_duration': sum(durations) / len(durations) if durations else 0.0,
+        'max_duration': max(durations, default=0.0),
+        'total_steps': sum(r['steps'] for r in results)
+    }
+    return {'results': results, 'stats': stats}
@@ -1,34 +1,202 @@
 from flask import Flask, render_template, request, jsonify
-from pseudocode_interpreter import PseudocodeInterpreter
+import pseudocode_interpreter
+from pseudocode_interpreter import PseudocodeInterpreter, QueuedInputProvider, ScriptedInputProvider, InputRequired
+from trace_serializer import diff_variables, write_trace, TraceReader, VERSION as TRACE_FORMAT_VERSION
 import json
+import gzip
+import hashlib
 import os
 import traceback
 import logging
 import sys
 import difflib
+import uuid
+import time
+import threading
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', stream=sys.stdout)
 logger = logging.getLogger(__name__)
 
+STEP_BATCH_SIZE = 200
+MAX_STEP_BATCH_SIZE = 2000
+MIN_COMPRESS_SIZE = 512
+# A mid-range level costs far less CPU than gzip's default of 9 for nearly
+# the same size on JSON
+GZIP_LEVEL = 6
+
 app = Flask(__name__)
 interpreter = PseudocodeInterpreter()
 
+# Programs paused on INPUT, keyed by session id. Each entry keeps the source
+# and the inputs supplied so far; no thread is held while waiting.
+INPUT_SESSION_TTL = 600
+MAX_INPUT_SESSIONS = 1000
+input_sessions = {}
+input_sessions_lock = threading.Lock()
+
+# Every INPUT replays the program from the start, so web runs are bounded to
+# keep a runaway program from tying up a worker thread on each retry
+WEB_MAX_STEPS = 200_000
+WEB_TIME_LIMIT = 5.0
+
 if not os.path.exists('snippets'):
     os.makedirs('snippets')
 
+# Finished step-by-step traces, keyed by program, inputs and memoize flag, so
+# a restarted server or another worker can replay them without re-running.
+# The key also covers the interpreter source and trace format version, so a
+# change to either never serves traces recorded with the old behaviour.
+TRACE_DIR = 'traces'
+TRACE_CACHE_MAX_FILES = 500
+TRACE_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+if not os.path.exists(TRACE_DIR):
+    os.makedirs(TRACE_DIR)
+
+with open(pseudocode_interpreter.__file__, 'rb') as f:
+    INTERPRETER_FINGERPRINT = hashlib.sha256(f.read()).hexdigest()
+
 @app.route('/')
 def index():
     logger.debug("Serving index page")
     return render_template('index.html')
 
+def prune_input_sessions():
+    """Drop sessions idle for longer than the TTL, then the oldest ones over the cap."""
+    now = time.monotonic()
+    with input_sessions_lock:
+        for session_id, session in list(input_sessions.items()):
+            if now - session['last_used'] > INPUT_SESSION_TTL:
+                del input_sessions[session_id]
+        while len(input_sessions) >= MAX_INPUT_SESSIONS:
+            oldest = min(input_sessions, key=lambda s: input_sessions[s]['last_used'])
+            del input_sessions[oldest]
+
+def create_input_session(pseudocode, mode, memoize):
+    prune_input_sessions()
+    session_id = uuid.uuid4().hex
+    with input_sessions_lock:
+        input_sessions[session_id] = {
+            'pseudocode': pseudocode,
+            'mode': mode,
+            'memoize': memoize,
+            'inputs': QueuedInputProvider(),
+            'last_used': time.monotonic()
+        }
+    return session_id
+
+def trace_cache_path(session, inputs):
+    key = json.dumps([INTERPRETER_FINGERPRINT, TRACE_FORMAT_VERSION,
+                      session['pseudocode'], inputs, session['memoize']])
+    return os.path.join(TRACE_DIR, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.pptr')
+
+def load_cached_trace(session, inputs):
+    """Return an interpreter whose steps come from a cached trace file, or None."""
+    path = trace_cache_path(session, inputs)
+    if not os.path.exists(path):
+        return None
+    try:
+        reader = TraceReader(path)
+        # Decoding the last step touches the index, a keyframe and the
+        # string table, so a damaged file is caught here rather than in /steps
+        if len(reader):
+            reader[len(reader) - 1]
+    except Exception as e:
+        logger.warning(f"Removing unreadable trace cache {path}: {str(e)}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    os.utime(path)
+    cached = PseudocodeInterpreter()
+    cached.execution_steps = reader
+    logger.debug(f"Loaded {len(reader)} steps from trace cache {path}")
+    return cached
+
+def save_cached_trace(session, inputs, run):
+    path = trace_cache_path(session, inputs)
+    try:
+        write_trace(path, run.execution_steps, session['pseudocode'])
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not write trace cache {path}: {str(e)}")
+    prune_trace_cache()
+
+def prune_trace_cache():
+    """Drop cached traces older than the max age, then the least recently used over the cap."""
+    now = time.time()
+    entries = []
+    for name in os.listdir(TRACE_DIR):
+        path = os.path.join(TRACE_DIR, name)
+        try:
+            mtime = os.path.getmtime(path)
+            if now - mtime > TRACE_CACHE_MAX_AGE:
+                os.remove(path)
+            elif name.endswith('.pptr'):
+                entries.append((mtime, path))
+        except OSError:
+            continue
+    entries.sort()
+    for _, path in entries[:max(len(entries) - TRACE_CACHE_MAX_FILES, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def run_input_session(session_id):
+    """Run a session's program from the start, replaying the inputs supplied so far.
+
+    Each run gets its own interpreter and its own snapshot of the inputs, so
+    concurrent runs, even for the same session, never share a read position. Step-by-step runs become the interpreter used by
+    /next_step and /steps; once finished their trace is cached on disk and
+    later runs with the same program and inputs are served from it.
+
+    Returns (result, waiting_for_input). When the program reaches an INPUT with
+    no queued value it is paused and the session is kept for /provide_input.
+    Any other failure, including going over the step or time limit, ends the
+    session and is raised to the caller.
+    """
+    global interpreter
+    session = input_sessions[session_id]
+    provider = session['inputs'].snapshot()
+    if session['mode'] == 'step':
+        cached = load_cached_trace(session, provider.values)
+        if cached is not None:
+            interpreter = cached
+            with input_sessions_lock:
+                input_sessions.pop(session_id, None)
+            return None, None
+    run = PseudocodeInterpreter(input_provider=provider, memoize=session['memoize'],
+                               max_steps=WEB_MAX_STEPS, time_limit=WEB_TIME_LIMIT)
+    try:
+        result = run.interpret(session['pseudocode'])
+    except InputRequired as e:
+        logger.debug(f"Session {session_id} waiting for input '{e.variable}'")
+        session['last_used'] = time.monotonic()
+        waiting = {'session_id': session_id, 'variable': e.variable}
+        return '\n'.join(run.output), waiting
+    except Exception:
+        with input_sessions_lock:
+            input_sessions.pop(session_id, None)
+        raise
+    finally:
+        if session['mode'] == 'step':
+            interpreter = run
+    if session['mode'] == 'step':
+        save_cached_trace(session, provider.values, run)
+    with input_sessions_lock:
+        input_sessions.pop(session_id, None)
+    return result, None
+
 @app.route('/interpret', methods=['POST'])
 def interpret():
     pseudocode = request.json.get('pseudocode', '')
     try:
         logger.debug(f"Interpreting pseudocode: {pseudocode[:50]}...")
-        result = interpreter.interpret(pseudocode)
-        return jsonify({'result': result, 'error': None})
+        memoize = request.json.get('memoize', True)
+        session_id = create_input_session(pseudocode, 'interpret', memoize)
+        result, waiting = run_input_session(session_id)
+        return jsonify({'result': result, 'error': None, 'waiting_for_input': waiting})
     except Exception as e:
         logger.error(f"Error interpreting pseudocode: {str(e)}")
         return jsonify({'result': None, 'error': str(e)})
@@ -37,9 +205,46 @@ def interpret():
 def start_execution():
     pseudocode = request.json.get('pseudocode', '')
     logger.debug(f"Starting execution of pseudocode: {pseudocode[:50]}...")
-    interpreter.interpret(pseudocode)
-    interpreter.reset_execution()
-    return jsonify({'message': 'Execution started'})
+    # Step-by-step runs show every procedure call in the trace unless asked otherwise
+    memoize = request.json.get('memoize', False)
+    session_id = create_input_session(pseudocode, 'step', memoize)
+    try:
+        _, waiting = run_input_session(session_id)
+    except Exception as e:
+        logger.error(f"Error starting execution: {str(e)}")
+        return jsonify({'error': str(e)})
+    return jsonify({'message': 'Execution started', 'waiting_for_input': waiting})
+
+@app.route('/provide_input', methods=['POST'])
+def provide_input():
+    session_id = request.json.get('session_id')
+    value = request.json.get('value', '')
+    session = input_sessions.get(session_id)
+    if session is None:
+        logger.warning(f"Input provided for unknown session '{session_id}'")
+        return jsonify({'error': 'Input session not found'}), 404
+
+    session['inputs'].push(value)
+    mode = session['mode']
+    try:
+        result, waiting = run_input_session(session_id)
+    except Exception as e:
+        logger.error(f"Error resuming session {session_id}: {str(e)}")
+        return jsonify({'result': None, 'error': str(e)})
+
+    if mode == 'step':
+        return jsonify({'message': 'Execution started', 'waiting_for_input': waiting})
+    return jsonify({'result': result, 'error': None, 'waiting_for_input': waiting})
+
+@app.route('/cancel_input', methods=['POST'])
+def cancel_input():
+    session_id = request.json.get('session_id')
+    with input_sessions_lock:
+        session = input_sessions.pop(session_id, None)
+    if session is None:
+        return jsonify({'error': 'Input session not found'}), 404
+    logger.debug(f"Session {session_id} cancelled")
+    return jsonify({'message': 'Input cancelled'})
 
 @app.route('/next_step', methods=['GET'])
 def next_step():
@@ -50,6 +255,52 @@ def next_step():
     else:
         return jsonify({'message': 'Execution completed'})
 
+def compressed_json(payload):
+    """JSON response, gzip-compressed when the client accepts it."""
+    body = json.dumps(payload).encode('utf-8')
+    encoding = None
+    if len(body) >= MIN_COMPRESS_SIZE:
+        if 'gzip' in request.accept_encodings:
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+            encoding = 'gzip'
+    response = app.response_class(body, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@app.route('/steps', methods=['GET'])
+def steps():
+    """Return a batch of steps as variable deltas.
+
+    The first step in the batch is a delta against step `from - 1` (or against
+    no variables when `from` is 0), so clients should request batches in order.
+    """
+    start = max(request.args.get('from', 0, type=int), 0)
+    count = request.args.get('count', STEP_BATCH_SIZE, type=int)
+    count = max(1, min(count, MAX_STEP_BATCH_SIZE))
+    logger.debug(f"Getting steps {start} to {start + count - 1}")
+
+    execution_steps = interpreter.execution_steps
+    if 0 < start <= len(execution_steps):
+        previous = execution_steps[start - 1]['variables']
+    else:
+        previous = {}
+
+    batch = []
+    for step in execution_steps[start:start + count]:
+        changed, removed = diff_variables(previous, step['variables'])
+        batch.append({
+            'line': step['line'],
+            'output': step['output'],
+            'error': step['error'],
+            'changed': changed,
+            'removed': removed
+        })
+        previous = step['variables']
+
+    return compressed_json({'from': start, 'steps': batch, 'total': len(execution_steps)})
+
 @app.route('/example')
 def example():
     logger.debug("Serving example code")
@@ -221,31 +472,33 @@ def list_snippets():
 @app.route('/test_consistency', methods=['POST'])
 def test_consistency():
     pseudocode = request.json.get('pseudocode', '')
+    # Values for INPUT statements; running out is reported as a program error
+    inputs = request.json.get('inputs', [])
     logger.debug(f"Testing consistency for pseudocode: {pseudocode[:50]}...")
     
     try:
         # Full interpretation
-        interpreter.reset_execution()
-        full_result = interpreter.interpret(pseudocode)
-        full_output = interpreter.output
-        full_variables = interpreter.get_all_variables()
-        full_error = interpreter.error
+        full_interpreter = PseudocodeInterpreter(input_provider=ScriptedInputProvider(inputs))
+        full_result = full_interpreter.interpret(pseudocode)
+        full_output = full_interpreter.output
+        full_variables = full_interpreter.get_all_variables()
+        full_error = full_interpreter.error
         
         # Step-by-step execution
-        interpreter.reset_execution()
-        interpreter.interpret(pseudocode)
+        step_interpreter = PseudocodeInterpreter(input_provider=ScriptedInputProvider(inputs))
+        step_interpreter.interpret(pseudocode)
         step_result = []
         step_output = []
         step_variables = []
         step_error = None
         
         while True:
-            step = interpreter.get_next_step()
+            step = step_interpreter.get_next_step()
             if step is None:
                 break
             if step['output'] is not None:
                 step_result.append(step['output'])
-            step_output.append(step['output'])
+                step_output.append(step['output'])
             step_variables.append(step['variables'])
             if step['error'] is not None:
                 step_error = step['error']
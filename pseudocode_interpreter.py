@@ -1,4 +1,13 @@
 import re
+import time
+from collections import OrderedDict
+
+# Words that may appear in a procedure body without referring to a variable
+PURITY_KEYWORDS = {
+    'IF', 'THEN', 'ELSE', 'ENDIF', 'FOR', 'TO', 'NEXT', 'WHILE', 'DO', 'ENDWHILE',
+    'DECLARE', 'ARRAY', 'OF', 'AND', 'OR', 'NOT', 'MOD', 'TRUE', 'FALSE',
+    'INTEGER', 'REAL', 'CHAR', 'STRING', 'BOOLEAN', 'RETURN', 'RETURNS'
+}
 
 class Scope:
     def __init__(self, parent=None):
@@ -15,8 +24,96 @@ class Scope:
     def set(self, name, value, type_):
         self.variables[name] = {'value': value, 'type': type_}
 
+class InputRequired(Exception):
+    """Raised when an INPUT statement runs and no value is available yet."""
+    def __init__(self, variable):
+        super().__init__(f"Waiting for input for '{variable}'")
+        self.variable = variable
+
+class ExecutionLimitExceeded(Exception):
+    """Raised when a run goes over its step or time limit, carrying the output produced so far."""
+    def __init__(self, message):
+        super().__init__(message)
+        self.output = []
+
+class ReturnSignal(Exception):
+    """Carries a RETURN value, and any output produced before it, out of a FUNCTION body."""
+    def __init__(self, value):
+        super().__init__("RETURN")
+        self.value = value
+        self.output = []
+
+class InputProvider:
+    """Supplies values for INPUT statements."""
+    def read(self, variable):
+        raise NotImplementedError
+
+class ConsoleInputProvider(InputProvider):
+    def read(self, variable):
+        return input(f"Enter value for {variable}: ")
+
+class ScriptedInputProvider(InputProvider):
+    def __init__(self, values):
+        self.values = list(values)
+        self.position = 0
+
+    def read(self, variable):
+        if self.position >= len(self.values):
+            raise ValueError(f"No more input available for '{variable}'")
+        value = self.values[self.position]
+        self.position += 1
+        return value
+
+class CallbackInputProvider(InputProvider):
+    def __init__(self, callback):
+        self.callback = callback
+
+    def read(self, variable):
+        return self.callback(variable)
+
+class QueuedInputProvider(InputProvider):
+    """Non-blocking provider for web sessions.
+
+    Values are kept after they are consumed so a paused program can be
+    replayed from the start with rewind() and reach the paused INPUT with
+    exactly the same state. When the queue runs dry, InputRequired is raised
+    instead of blocking.
+    """
+    def __init__(self, values=None):
+        self.values = list(values or [])
+        self.position = 0
+
+    def snapshot(self):
+        """Copy of the values pushed so far, read from the start."""
+        return QueuedInputProvider(self.values)
+
+    def push(self, value):
+        self.values.append(value)
+
+    def rewind(self):
+        self.position = 0
+
+    def read(self, variable):
+        if self.position >= len(self.values):
+            raise InputRequired(variable)
+        value = self.values[self.position]
+        self.position += 1
+        return value
+
 class PseudocodeInterpreter:
-    def __init__(self):
+    def __init__(self, input_provider=None, memoize=True, memo_size=1024, max_steps=None, time_limit=None,
+                 record_steps=True):
+        self.input_provider = input_provider or ConsoleInputProvider()
+        # Batch runs only need the output, so they can skip building the step trace
+        self.record_steps = record_steps
+        self.max_steps = max_steps
+        self.time_limit = time_limit
+        self.steps_taken = 0
+        self.deadline = None
+        self.memoize = memoize
+        self.memo_size = memo_size
+        self.memo_cache = OrderedDict()
+        self.procedure_purity = {}
         self.global_scope = Scope()
         self.scope_stack = [self.global_scope]
         self.procedures = {}
@@ -26,6 +123,8 @@ class PseudocodeInterpreter:
         self.loop_stack = []
         self.current_line = 0
         self.error = None
+        self.error_count = 0
+        self.call_output = []
 
     @property
     def current_scope(self):
@@ -46,53 +145,95 @@ class PseudocodeInterpreter:
         self.scope_stack = [self.global_scope]
         self.current_line = 0
         self.error = None
-        lines = pseudocode.split('\n')
+        self.error_count = 0
+        self.call_output = []
+        self.steps_taken = 0
+        self.deadline = time.perf_counter() + self.time_limit if self.time_limit is not None else None
+        return self.execute_block(pseudocode, self.output)
+
+    def tick(self):
+        """Count one line or loop iteration against max_steps and time_limit."""
+        self.steps_taken += 1
+        if self.max_steps is not None and self.steps_taken > self.max_steps:
+            raise ExecutionLimitExceeded(f"Step limit of {self.max_steps} exceeded")
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise ExecutionLimitExceeded(f"Time limit of {self.time_limit}s exceeded")
+
+    def execute_block(self, pseudocode, output=None):
+        """Run a block of lines in the current scope and return its joined output.
+
+        Nested blocks (IF branches, loop bodies, procedure bodies) use this
+        instead of interpret() so the scope stack, trace and output of the
+        enclosing code are kept.
+        """
+        output = output if output is not None else []
+        lines = [line.strip() for line in pseudocode.split('\n')]
         i = 0
         while i < len(lines):
             self.current_line = i + 1
-            line = lines[i].strip()
+            line = lines[i]
             if line and not line.startswith('#'):  # Ignore empty lines and comments
                 try:
                     result, i = self.execute_line(lines, i)
+                    # Output from FUNCTION calls inside expressions on this line
+                    output.extend(self.call_output)
+                    self.call_output = []
                     if result is not None:
-                        self.output.append(result)
+                        output.append(result)
+                except (ReturnSignal, ExecutionLimitExceeded) as signal:
+                    output.extend(self.call_output)
+                    self.call_output = []
+                    signal.output = output + signal.output
+                    raise
+                except InputRequired:
+                    raise
                 except Exception as e:
                     error_msg = self.format_error(str(e), i, line)
-                    self.output.append(error_msg)
+                    output.append(error_msg)
                     self.error = error_msg
-                    self.execution_steps.append({
-                        'line': line,
-                        'variables': self.get_all_variables(),
-                        'output': error_msg,
-                        'error': error_msg
-                    })
+                    self.error_count += 1
+                    if self.record_steps:
+                        self.execution_steps.append({
+                            'line': line,
+                            'variables': self.get_all_variables(),
+                            'output': error_msg,
+                            'error': error_msg
+                        })
                     break
             i += 1
-        return '\n'.join(self.output)
+        return '\n'.join(output)
 
     def execute_line(self, lines, i):
+        self.tick()
         line = lines[i].strip()
-        self.execution_steps.append({
-            'line': line,
-            'variables': self.get_all_variables(),
-            'output': None,
-            'error': None
-        })
+        if self.record_steps:
+            self.execution_steps.append({
+                'line': line,
+                'variables': self.get_all_variables(),
+                'output': None,
+                'error': None
+            })
         
         if line.startswith('OUTPUT'):
             result = self.output_statement(line)
-            self.execution_steps[-1]['output'] = result
+            if self.record_steps:
+                self.execution_steps[-1]['output'] = result
             return result, i
         elif line.startswith('INPUT'):
             self.input_statement(line)
             return None, i
+        elif line.startswith('RETURN'):
+            self.return_statement(line)
+        elif line.startswith('FUNCTION'):
+            return self.procedure_definition(lines, i)
+        elif line.startswith('FOR'):
+            # Before assignment: FOR lines contain ← too
+            return self.for_loop(lines, i)
         elif '←' in line:
             self.assignment(line)
             return None, i
         elif line.startswith('IF'):
             return self.if_statement(lines, i)
-        elif line.startswith('FOR'):
-            return self.for_loop(lines, i)
         elif line.startswith('WHILE'):
             return self.while_loop(lines, i)
         elif line.startswith('PROCEDURE'):
@@ -103,7 +244,7 @@ class PseudocodeInterpreter:
         elif line.startswith('ARRAY'):
             self.array_declaration(line)
             return None, i
-        elif line in ['NEXT', 'ENDWHILE', 'ENDIF', 'ENDPROCEDURE']:
+        elif line in ['NEXT', 'ENDWHILE', 'ENDIF', 'ENDPROCEDURE', 'ENDFUNCTION']:
             if self.loop_stack and self.loop_stack[-1][0] == line[3:]:
                 self.loop_stack.pop()
             self.pop_scope()
@@ -113,7 +254,8 @@ class PseudocodeInterpreter:
             procedure_match = re.match(r'(\w+)\s*\((.*?)\)', line)
             if procedure_match:
                 result = self.procedure_call(line)
-                self.execution_steps[-1]['output'] = result
+                if self.record_steps:
+                    self.execution_steps[-1]['output'] = result
                 return result, i
             raise ValueError(f"Unsupported command: {line}")
 
@@ -126,7 +268,7 @@ class PseudocodeInterpreter:
             else:
                 try:
                     return str(self.evaluate_expression(content))
-                except:
+                except ValueError:
                     # If evaluation fails, treat it as a variable name
                     return str(self.get_variable(content)['value'])
         raise ValueError(f"Invalid OUTPUT statement: {line}")
@@ -135,11 +277,21 @@ class PseudocodeInterpreter:
         match = re.match(r'INPUT\s+(\w+)', line)
         if match:
             variable = match.group(1)
-            value = input(f"Enter value for {variable}: ")
+            value = self.input_provider.read(variable)
             self.current_scope.set(variable, value, 'STRING')
         else:
             raise ValueError(f"Invalid INPUT statement: {line}")
 
+    def return_statement(self, line):
+        # The innermost call decides, so RETURN in a PROCEDURE called from a FUNCTION is an error
+        calls = [frame[0] for frame in self.loop_stack if frame[0] in ('FUNCTION', 'PROCEDURE')]
+        if not calls or calls[-1] != 'FUNCTION':
+            raise ValueError("RETURN can only be used inside a FUNCTION")
+        match = re.match(r'RETURN\s+(.+)', line)
+        if not match:
+            raise ValueError(f"Invalid RETURN statement: {line}")
+        raise ReturnSignal(self.evaluate_expression(match.group(1).strip()))
+
     def assignment(self, line):
         variable, expression = map(str.strip, line.split('←'))
         if '[' in variable:  # Array assignment
@@ -155,7 +307,14 @@ class PseudocodeInterpreter:
         else:
             value = self.evaluate_expression(expression)
             var_type = self.infer_type(value)
-            self.current_scope.set(variable, value, var_type)
+            # Update the variable where it already exists so loop and IF bodies
+            # can change variables of the enclosing code
+            for scope in reversed(self.scope_stack):
+                if variable in scope.variables:
+                    scope.set(variable, value, var_type)
+                    break
+            else:
+                self.current_scope.set(variable, value, var_type)
 
     def if_statement(self, lines, i):
         condition_match = re.match(r'IF\s+(.+)\s+THEN', lines[i])
@@ -185,9 +344,9 @@ class PseudocodeInterpreter:
         self.push_scope()
         
         if self.evaluate_expression(condition):
-            result = self.interpret('\n'.join(true_block))
+            result = self.execute_block('\n'.join(true_block))
         else:
-            result = self.interpret('\n'.join(false_block))
+            result = self.execute_block('\n'.join(false_block))
         
         self.pop_scope()
         return result, i - 1
@@ -223,10 +382,15 @@ class PseudocodeInterpreter:
         output = []
         
         for j in range(start_value, end_value + 1):
+            self.tick()
             self.push_scope()
             self.current_scope.set(var, j, 'INTEGER')
             self.loop_stack.append(('FOR', var, j))
-            result = self.interpret('\n'.join(loop_block))
+            try:
+                result = self.execute_block('\n'.join(loop_block))
+            except (ReturnSignal, ExecutionLimitExceeded) as signal:
+                signal.output = output + signal.output
+                raise
             if result:
                 output.append(result)
             self.loop_stack.pop()
@@ -261,9 +425,14 @@ class PseudocodeInterpreter:
         output = []
         iteration = 0
         while self.evaluate_expression(condition):
+            self.tick()
             self.push_scope()
             self.loop_stack.append(('WHILE', None, iteration))
-            result = self.interpret('\n'.join(loop_block))
+            try:
+                result = self.execute_block('\n'.join(loop_block))
+            except (ReturnSignal, ExecutionLimitExceeded) as signal:
+                signal.output = output + signal.output
+                raise
             if result:
                 output.append(result)
             self.loop_stack.pop()
@@ -273,29 +442,37 @@ class PseudocodeInterpreter:
         return '\n'.join(output), i - 1
 
     def procedure_definition(self, lines, i):
-        match = re.match(r'PROCEDURE\s+(\w+)\s*\((.*?)\)', lines[i])
+        """Define a PROCEDURE, or a FUNCTION whose body hands a value back with RETURN."""
+        match = re.match(r'(PROCEDURE|FUNCTION)\s+(\w+)\s*\((.*?)\)(?:\s+RETURNS\s+(\w+))?', lines[i])
         if not match:
             raise ValueError(f"Invalid procedure definition on line {self.current_line}: {lines[i]}")
         
-        proc_name, params = match.groups()
+        kind, proc_name, params, return_type = match.groups()
         params = [p.strip() for p in params.split(',') if p.strip()]
+        end_keyword = 'END' + kind
         i += 1
         proc_body = []
+        closed = False
         
         while i < len(lines):
-            if lines[i].strip() == 'ENDPROCEDURE':
+            if lines[i].strip() == end_keyword:
+                closed = True
                 i += 1
                 break
             proc_body.append(lines[i])
             i += 1
         
-        if i == len(lines):
-            raise ValueError(f"Procedure '{proc_name}' not properly closed with ENDPROCEDURE")
+        if not closed:
+            raise ValueError(f"{kind.capitalize()} '{proc_name}' not properly closed with {end_keyword}")
         
         self.procedures[proc_name] = {
             'params': params,
-            'body': proc_body
+            'body': proc_body,
+            'function': kind == 'FUNCTION',
+            'returns': return_type
         }
+        self.memo_cache.clear()
+        self.procedure_purity.clear()
         
         return None, i - 1
 
@@ -306,7 +483,22 @@ class PseudocodeInterpreter:
         
         proc_name, args = match.groups()
         args = [self.evaluate_expression(arg.strip()) for arg in args.split(',') if arg.strip()]
-        
+        result, _ = self.invoke(proc_name, args)
+        return result
+
+    def function_call(self, proc_name, args):
+        """Call a FUNCTION from inside an expression and return its RETURN value."""
+        result, value = self.invoke(proc_name, list(args))
+        if result:
+            self.call_output.append(result)
+        return value
+
+    def invoke(self, proc_name, args):
+        """Run a procedure or function body with its parameters bound.
+
+        Returns (output, return_value). Calls to pure procedures are served from
+        the memo cache when memoization is on.
+        """
         if proc_name not in self.procedures:
             raise ValueError(f"Procedure '{proc_name}' is not defined")
         
@@ -314,16 +506,150 @@ class PseudocodeInterpreter:
         if len(args) != len(proc['params']):
             raise ValueError(f"Procedure '{proc_name}' expects {len(proc['params'])} arguments, but {len(args)} were given")
         
+        memo_key = None
+        if self.memoize and self.is_pure_procedure(proc_name):
+            memo_key = self.memo_key(proc_name, args)
+            if memo_key is not None and memo_key in self.memo_cache:
+                self.memo_cache.move_to_end(memo_key)
+                result, value = self.memo_cache[memo_key]
+                return result, list(value) if isinstance(value, list) else value
+        
+        scope_depth = len(self.scope_stack)
+        loop_depth = len(self.loop_stack)
+        errors_before = self.error_count
+        caller_output = self.call_output
+        self.call_output = []
+        
         self.push_scope()
         for param, arg in zip(proc['params'], args):
             self.current_scope.set(param, arg, self.infer_type(arg))
         
-        self.loop_stack.append(('PROCEDURE', proc_name, 0))
-        result = self.interpret('\n'.join(proc['body']))
-        self.loop_stack.pop()
-        self.pop_scope()
+        self.loop_stack.append(('FUNCTION' if proc['function'] else 'PROCEDURE', proc_name, 0))
+        value = None
+        returned = False
+        try:
+            result = self.execute_block('\n'.join(proc['body']))
+        except ReturnSignal as signal:
+            result = '\n'.join(signal.output)
+            value = signal.value
+            returned = True
+        finally:
+            # RETURN can leave from inside nested IF/loop scopes
+            del self.scope_stack[scope_depth:]
+            del self.loop_stack[loop_depth:]
+            self.call_output = caller_output
+        
+        if proc['function'] and not returned and self.error_count == errors_before:
+            raise ValueError(f"Function '{proc_name}' ended without RETURN")
+        
+        # Runs that ended in an error are not cached so the error is reported every time
+        if memo_key is not None and self.error_count == errors_before:
+            # Store a copy so the caller can't change the cached array
+            self.memo_cache[memo_key] = (result, list(value) if isinstance(value, list) else value)
+            if len(self.memo_cache) > self.memo_size:
+                self.memo_cache.popitem(last=False)
+        
+        return result, value
+
+    def memo_key(self, proc_name, args):
+        """Build a hashable cache key from the arguments, or None if they can't be frozen."""
+        def freeze(value):
+            if isinstance(value, list):
+                return ('list', tuple(freeze(v) for v in value))
+            # Keep the type so 1, 1.0 and TRUE don't share a cache entry
+            return (type(value).__name__, value)
+        try:
+            key = (proc_name, tuple(freeze(arg) for arg in args))
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def is_pure_procedure(self, proc_name, visiting=None):
+        """Check whether a procedure's result depends only on its arguments.
+
+        A procedure or function is pure if it has no OUTPUT or INPUT, only
+        reads and writes its parameters and variables it has already declared,
+        only writes to arrays it declared itself, and only calls other pure
+        procedures.
+        """
+        if proc_name in self.procedure_purity:
+            return self.procedure_purity[proc_name]
+        
+        top_level = visiting is None
+        visiting = visiting if visiting is not None else set()
+        if proc_name in visiting:
+            # Recursive call: decided by the rest of the body
+            return True
+        visiting.add(proc_name)
         
-        return result
+        proc = self.procedures[proc_name]
+        body = [line.strip() for line in proc['body']]
+        body = [line for line in body if line and not line.startswith('#')]
+        
+        # A name only counts as local from its DECLARE or ARRAY (or as a
+        # parameter or FOR variable) until the end of the block it was declared
+        # in. Assigning to any other name may update a caller's or global
+        # variable. Maps name -> whether it is a local array.
+        blocks = [dict.fromkeys(proc['params'], False)]
+        
+        def local_array(name):
+            for block in reversed(blocks):
+                if name in block:
+                    return block[name]
+            return False
+        
+        def reads_are_pure(code):
+            code = re.sub(r'"[^"]*"', '""', code)
+            for name in re.findall(r'\b[a-zA-Z_]\w*\b', code):
+                if name in PURITY_KEYWORDS or any(name in block for block in blocks):
+                    continue
+                if name in self.procedures and self.is_pure_procedure(name, visiting):
+                    continue
+                return False
+            return True
+        
+        pure = True
+        for line in body:
+            if line.startswith(('OUTPUT', 'INPUT', 'PROCEDURE', 'FUNCTION')):
+                pure = False
+            elif line.startswith(('ENDIF', 'NEXT', 'ENDWHILE')):
+                if len(blocks) > 1:
+                    blocks.pop()
+            elif line.startswith('ELSE'):
+                if len(blocks) > 1:
+                    blocks[-1] = {}
+            elif line.startswith('FOR'):
+                loop = re.match(r'FOR\s+(\w+)\s*←\s*(.+)', line)
+                pure = loop is not None and reads_are_pure(loop.group(2))
+                if pure:
+                    blocks.append({loop.group(1): False})
+            elif line.startswith(('IF', 'WHILE')):
+                pure = reads_are_pure(line)
+                blocks.append({})
+            elif line.startswith(('DECLARE', 'ARRAY')):
+                declaration = re.match(r'(DECLARE|ARRAY)\s+(\w+)', line)
+                if declaration:
+                    blocks[-1][declaration.group(2)] = declaration.group(1) == 'ARRAY'
+            elif '←' in line:
+                target, expression = map(str.strip, line.split('←', 1))
+                array_write = re.match(r'(\w+)\[(.+)\]', target)
+                if array_write:
+                    pure = (local_array(array_write.group(1))
+                            and reads_are_pure(array_write.group(2))
+                            and reads_are_pure(expression))
+                else:
+                    pure = any(target in block for block in blocks) and reads_are_pure(expression)
+            else:
+                pure = reads_are_pure(line)
+            if not pure:
+                break
+        
+        visiting.discard(proc_name)
+        # Results that assumed a recursive call was pure are only final at the top level
+        if top_level:
+            self.procedure_purity[proc_name] = pure
+        return pure
 
     def variable_declaration(self, line):
         match = re.match(r'DECLARE\s+(\w+)\s*:\s*(\w+)', line)
@@ -373,15 +699,22 @@ class PseudocodeInterpreter:
                 if var in self.get_all_variables():
                     var_value = self.get_variable(var)['value']
                     if isinstance(var_value, str):
-                        expression = expression.replace(var, f'"{var_value}"')
+                        replacement = f'"{var_value}"'
                     else:
-                        expression = expression.replace(var, str(var_value))
+                        replacement = str(var_value)
+                    # Whole words only, so a variable 'i' doesn't rewrite the 'i' in 'fib'
+                    expression = re.sub(rf'\b{re.escape(var)}\b', lambda _: replacement, expression)
 
             expression = expression.replace('≠', '!=')
             # Replace ^ with ** for exponentiation
             expression = expression.replace('^', '**')
 
+            functions = {
+                name: (lambda *args, name=name: self.function_call(name, args))
+                for name, proc in self.procedures.items() if proc['function']
+            }
             return eval(expression, {"__builtins__": None}, {
+                **functions,
                 "+": lambda x, y: x + y,
                 "-": lambda x, y: x - y,
                 "*": lambda x, y: x * y,
@@ -398,6 +731,8 @@ class PseudocodeInterpreter:
                 "NOT": lambda x: not x,
             })
 
+        except (InputRequired, ExecutionLimitExceeded):
+            raise
         except Exception as e:
             loop_info = self.get_loop_info()
             raise ValueError(f"Invalid expression: {expression}. Error: {str(e)}. {loop_info}")
@@ -429,6 +764,8 @@ class PseudocodeInterpreter:
         self.global_scope = Scope()
         self.scope_stack = [self.global_scope]
         self.procedures = {}
+        self.memo_cache.clear()
+        self.procedure_purity.clear()
         self.output = []
         self.loop_stack = []
         self.current_line = 0
@@ -10,6 +10,14 @@ document.addEventListener('DOMContentLoaded', () => {
     const outputDiv = document.getElementById('output');
     const variableStateDiv = document.getElementById('variable-state');
 
+    const STEP_BATCH_SIZE = 200;
+    const PREFETCH_THRESHOLD = 50;
+    let stepBuffer = [];
+    let nextStepIndex = 0;
+    let totalSteps = null;
+    let stepFetch = null;
+    let currentVariables = {};
+
     function updateSyntaxHighlighting() {
       if (pseudocodeEditor.textContent.trim() === '') {
         pseudocodeEditor.innerHTML = '';
@@ -61,6 +69,33 @@ document.addEventListener('DOMContentLoaded', () => {
       }
     }
     
+    async function provideInputs(data) {
+        while (data.waiting_for_input) {
+            const { session_id, variable } = data.waiting_for_input;
+            const value = prompt(`Enter value for ${variable}:`);
+            if (value === null) {
+                await fetch('/cancel_input', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify({ session_id }),
+                });
+                data = { ...data, waiting_for_input: null };
+                break;
+            }
+            const response = await fetch('/provide_input', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ session_id, value }),
+            });
+            data = await response.json();
+        }
+        return data;
+    }
+
     interpretButton.addEventListener('click', async () => {
         const pseudocode = pseudocodeEditor.textContent;
         
@@ -73,12 +108,15 @@ document.addEventListener('DOMContentLoaded', () => {
                 body: JSON.stringify({ pseudocode }),
             });
 
-            const data = await response.json();
+            const data = await provideInputs(await response.json());
 
             if (data.error) {
                 outputDiv.innerHTML = `<span class="error">Error: ${data.error}</span>`;
             } else {
                 outputDiv.textContent = data.result;
+                if (data.waiting_for_input) {
+                    outputDiv.textContent += `\nWaiting for input: ${data.waiting_for_input.variable}`;
+                }
             }
             variableStateDiv.textContent = '';
         } catch (error) {
@@ -117,30 +155,83 @@ document.addEventListener('DOMContentLoaded', () => {
                 body: JSON.stringify({ pseudocode }),
             });
 
-            const data = await response.json();
-            outputDiv.textContent = '';
+            const data = await provideInputs(await response.json());
             variableStateDiv.textContent = '';
+            resetStepBuffer();
+            if (data.error) {
+                outputDiv.innerHTML = `<span class="error">Error: ${data.error}</span>`;
+                nextStepButton.disabled = true;
+                return;
+            }
+            outputDiv.textContent = '';
             nextStepButton.disabled = false;
+            prefetchSteps().catch(error => console.error('Error prefetching steps:', error));
         } catch (error) {
             outputDiv.innerHTML = `<span class="error">An error occurred: ${error.message}</span>`;
         }
     });
 
+    function resetStepBuffer() {
+        stepBuffer = [];
+        nextStepIndex = 0;
+        totalSteps = null;
+        stepFetch = null;
+        currentVariables = {};
+    }
+
+    function prefetchSteps() {
+        if (stepFetch || (totalSteps !== null && nextStepIndex >= totalSteps)) {
+            return stepFetch;
+        }
+        const request = fetch(`/steps?from=${nextStepIndex}&count=${STEP_BATCH_SIZE}`)
+            .then(response => response.json())
+            .then(data => {
+                if (request !== stepFetch) {
+                    return;
+                }
+                stepBuffer.push(...data.steps);
+                nextStepIndex = data.from + data.steps.length;
+                totalSteps = data.total;
+            })
+            .finally(() => {
+                if (request === stepFetch) {
+                    stepFetch = null;
+                }
+            });
+        stepFetch = request;
+        return request;
+    }
+
     nextStepButton.addEventListener('click', async () => {
         try {
-            const response = await fetch('/next_step');
-            const data = await response.json();
+            if (stepBuffer.length === 0) {
+                await prefetchSteps();
+            }
 
-            if (data.message === 'Execution completed') {
+            if (stepBuffer.length === 0) {
                 outputDiv.textContent += '\nExecution completed';
                 nextStepButton.disabled = true;
-            } else {
-                outputDiv.textContent += `\nExecuting: ${data.line}`;
-                if (data.output !== null) {
-                    outputDiv.textContent += `\nOutput: ${data.output}`;
+                return;
+            }
+
+            const step = stepBuffer.shift();
+            if (stepBuffer.length < PREFETCH_THRESHOLD) {
+                const pending = prefetchSteps();
+                if (pending) {
+                    pending.catch(error => console.error('Error prefetching steps:', error));
                 }
-                updateVariableState(data.variables);
             }
+
+            for (const key of step.removed) {
+                delete currentVariables[key];
+            }
+            Object.assign(currentVariables, step.changed);
+
+            outputDiv.textContent += `\nExecuting: ${step.line}`;
+            if (step.output !== null) {
+                outputDiv.textContent += `\nOutput: ${step.output}`;
+            }
+            updateVariableState(currentVariables);
         } catch (error) {
             outputDiv.innerHTML += `\n<span class="error">An error occurred: ${error.message}</span>`;
         }
@@ -0,0 +1,74 @@
+import multiprocessing
+import unittest
+from unittest import mock
+
+import batch_runner
+from batch_runner import run_test_cases
+
+ECHO = '''INPUT name
+OUTPUT name'''
+
+LOOP = '''OUTPUT "start"
+FOR i ← 1 TO 3
+OUTPUT i
+NEXT i
+IF 1 < 2 THEN
+OUTPUT "in if"
+ENDIF
+WHILE 1 < 2 DO
+OUTPUT "tick"
+ENDWHILE'''
+
+
+def echo_cases(count):
+    return [{'inputs': [f'case {n}'], 'expected_output': f'case {n}'} for n in range(count)]
+
+
+class BatchRunnerTest(unittest.TestCase):
+    def check_echo_results(self, report, count):
+        results = report['results']
+        self.assertEqual([r['index'] for r in results], list(range(count)))
+        self.assertEqual([r['output'] for r in results], [f'case {n}' for n in range(count)])
+        self.assertTrue(all(r['passed'] for r in results))
+        self.assertEqual(report['stats']['passed'], count)
+        self.assertIsNone(batch_runner._program)
+
+    def test_results_in_case_order(self):
+        report = run_test_cases(ECHO, echo_cases(12), processes=1)
+        self.check_echo_results(report, 12)
+        self.assertEqual(report['stats']['total_steps'], 24)
+
+    @unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), 'fork is not available')
+    def test_fork_pool(self):
+        with mock.patch('batch_runner.multiprocessing.get_start_method', return_value='fork'):
+            report = run_test_cases(ECHO, echo_cases(20), processes=2, chunksize=3)
+        self.check_echo_results(report, 20)
+
+    def test_spawn_pool(self):
+        with mock.patch('batch_runner.multiprocessing.get_start_method', return_value='spawn'):
+            report = run_test_cases(ECHO, echo_cases(20), processes=2, chunksize=3)
+        self.check_echo_results(report, 20)
+
+    def test_step_limit_keeps_partial_output(self):
+        report = run_test_cases(LOOP, [{}], processes=1, max_steps=20, time_limit=None)
+        result = report['results'][0]
+        self.assertTrue(result['limit_exceeded'])
+        self.assertEqual(result['error'], 'Step limit of 20 exceeded')
+        self.assertTrue(result['output'].startswith('start\n1\n2\n3\nin if\ntick'))
+        self.assertEqual(result['steps'], 21)
+        self.assertEqual(report['stats']['limit_exceeded'], 1)
+
+    def test_time_limit(self):
+        report = run_test_cases(LOOP, [{'time_limit': 0.05}], processes=1, max_steps=None)
+        result = report['results'][0]
+        self.assertTrue(result['limit_exceeded'])
+        self.assertEqual(result['error'], 'Time limit of 0.05s exceeded')
+
+    def test_failed_case(self):
+        report = run_test_cases(ECHO, [{'inputs': ['a'], 'expected_output': 'b'}], processes=1)
+        self.assertFalse(report['results'][0]['passed'])
+        self.assertEqual(report['stats']['failed'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
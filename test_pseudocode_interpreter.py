@@ -0,0 +1,158 @@
+import unittest
+
+from pseudocode_interpreter import PseudocodeInterpreter, ScriptedInputProvider
+
+
+def run(code, inputs=(), **options):
+    interpreter = PseudocodeInterpreter(input_provider=ScriptedInputProvider(list(inputs)), **options)
+    return interpreter, interpreter.interpret(code)
+
+
+FIB = '''FUNCTION fib(n)
+IF n < 2 THEN
+RETURN n
+ENDIF
+RETURN fib(n - 1) + fib(n - 2)
+ENDFUNCTION
+OUTPUT fib(15)'''
+
+
+class MemoizationTest(unittest.TestCase):
+    def test_fib_matches_unmemoized_in_fewer_steps(self):
+        memoized, memoized_output = run(FIB)
+        plain, plain_output = run(FIB, memoize=False)
+        self.assertEqual(memoized_output, '610')
+        self.assertEqual(plain_output, '610')
+        self.assertLess(memoized.steps_taken * 10, plain.steps_taken)
+
+    def test_cached_array_is_not_shared_with_caller(self):
+        _, output = run('''FUNCTION mk(n)
+ARRAY a[1:3] OF INTEGER
+a[0] ← n
+RETURN a
+ENDFUNCTION
+x ← mk(3)
+x[0] ← 99
+y ← mk(3)
+y[1] ← 98
+z ← mk(3)
+OUTPUT y[0]
+OUTPUT z[1]''')
+        self.assertEqual(output, '3\nNone')
+
+    def test_function_reading_global_is_not_cached(self):
+        interpreter, output = run('''k ← 1
+FUNCTION f(n)
+RETURN n + k
+ENDFUNCTION
+OUTPUT f(1)
+k ← 10
+OUTPUT f(1)''')
+        self.assertEqual(output, '2\n11')
+        self.assertFalse(interpreter.is_pure_procedure('f'))
+        self.assertEqual(len(interpreter.memo_cache), 0)
+
+    def test_undeclared_write_is_impure(self):
+        interpreter, _ = run('''PROCEDURE p(n)
+t ← n
+ENDPROCEDURE''')
+        self.assertFalse(interpreter.is_pure_procedure('p'))
+
+    def test_write_to_parameter_array_is_impure(self):
+        interpreter, _ = run('''PROCEDURE p(a)
+a[0] ← 1
+ENDPROCEDURE''')
+        self.assertFalse(interpreter.is_pure_procedure('p'))
+
+    def test_declared_local_is_pure(self):
+        interpreter, _ = run('''PROCEDURE p(n)
+DECLARE t : INTEGER
+t ← n
+ARRAY a[1:2] OF INTEGER
+a[0] ← t
+ENDPROCEDURE''')
+        self.assertTrue(interpreter.is_pure_procedure('p'))
+
+    def test_declaration_is_local_only_to_its_block(self):
+        inside, _ = run('''PROCEDURE p(n)
+IF n > 0 THEN
+DECLARE t : INTEGER
+t ← n
+ENDIF
+ENDPROCEDURE''')
+        self.assertTrue(inside.is_pure_procedure('p'))
+
+        after, _ = run('''PROCEDURE p(n)
+IF n > 0 THEN
+DECLARE t : INTEGER
+t ← n
+ENDIF
+t ← 2
+ENDPROCEDURE''')
+        self.assertFalse(after.is_pure_procedure('p'))
+
+    def test_failed_call_is_not_cached(self):
+        interpreter, _ = run('''FUNCTION inv(n)
+RETURN 10 / n
+ENDFUNCTION
+OUTPUT inv(0)
+OUTPUT inv(0)''')
+        self.assertEqual(len(interpreter.memo_cache), 0)
+        self.assertEqual(interpreter.error_count, 2)
+
+    def test_lru_eviction(self):
+        interpreter, output = run('''FUNCTION sq(n)
+RETURN n * n
+ENDFUNCTION
+OUTPUT sq(1)
+OUTPUT sq(2)
+OUTPUT sq(1)
+OUTPUT sq(3)''', memo_size=2)
+        self.assertEqual(output, '1\n4\n1\n9')
+        self.assertEqual(list(interpreter.memo_cache), [
+            interpreter.memo_key('sq', [1]),
+            interpreter.memo_key('sq', [3])
+        ])
+
+
+class ReturnTest(unittest.TestCase):
+    def test_return_outside_function(self):
+        interpreter, _ = run('RETURN 1')
+        self.assertIn('RETURN can only be used inside a FUNCTION', interpreter.error)
+
+    def test_return_in_procedure_called_from_function(self):
+        interpreter, _ = run('''PROCEDURE show()
+RETURN 1
+ENDPROCEDURE
+FUNCTION f(n)
+show()
+RETURN n
+ENDFUNCTION
+OUTPUT f(1)''')
+        self.assertIn('RETURN can only be used inside a FUNCTION', interpreter.error)
+
+    def test_return_from_inside_loop(self):
+        _, output = run('''FUNCTION first(n)
+FOR i ← 1 TO 10
+IF i > n THEN
+RETURN i
+ENDIF
+NEXT i
+RETURN 0
+ENDFUNCTION
+OUTPUT first(3)''')
+        self.assertEqual(output, '4')
+
+
+class RecordStepsTest(unittest.TestCase):
+    def test_record_steps_off(self):
+        recorded, recorded_output = run(FIB)
+        unrecorded, unrecorded_output = run(FIB, record_steps=False)
+        self.assertEqual(unrecorded_output, recorded_output)
+        self.assertEqual(unrecorded.execution_steps, [])
+        self.assertEqual(unrecorded.steps_taken, recorded.steps_taken)
+        self.assertTrue(recorded.execution_steps)
+
+
+if __name__ == '__main__':
+    unittest.main()
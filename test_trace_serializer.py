@@ -0,0 +1,82 @@
+import os
+import struct
+import tempfile
+import unittest
+
+from trace_serializer import encode_trace, decode_trace, write_trace, TraceReader
+
+
+def make_steps(count):
+    steps = []
+    variables = {}
+    for i in range(count):
+        variables = dict(variables)
+        variables['i'] = {'value': i, 'type': 'INTEGER'}
+        variables['big'] = {'value': -10 ** 30 - i, 'type': 'INTEGER'}
+        variables['neg'] = {'value': -i, 'type': 'INTEGER'}
+        variables['flag'] = {'value': i % 2 == 0, 'type': 'BOOLEAN'}
+        if i % 7 == 0:
+            variables['name'] = {'value': 'héllo ← ✓' * (i % 3), 'type': 'STRING'}
+        if i % 10 == 0:
+            variables['ints'] = {'value': [i, -i, 2 ** 62], 'type': 'ARRAY[1:3] OF INTEGER'}
+            variables['reals'] = {'value': [i / 4, -1.5], 'type': 'ARRAY[1:2] OF REAL'}
+            variables['mixed'] = {'value': [i, None, 'ü', 2 ** 70], 'type': 'ARRAY[1:4] OF STRING'}
+        if i == 40:
+            del variables['name']
+        steps.append({
+            'line': f'x ← {i % 5}',
+            'variables': variables,
+            'output': str(i) if i % 3 == 0 else None,
+            'error': 'Error ✗' if i == count - 1 else None
+        })
+    return steps
+
+
+class TraceSerializerTest(unittest.TestCase):
+    def test_round_trip(self):
+        steps = make_steps(100)
+        decoded, source = decode_trace(encode_trace(steps, source='OUTPUT "é"', keyframe_interval=8))
+        self.assertEqual(decoded, steps)
+        self.assertEqual(source, 'OUTPUT "é"')
+
+    def test_seek_and_slice_from_file(self):
+        steps = make_steps(100)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'trace.pptr')
+            write_trace(path, steps, keyframe_interval=8)
+            with TraceReader(path) as reader:
+                self.assertEqual(len(reader), 100)
+                for n in (0, 7, 8, 9, 41, 99, -1):
+                    self.assertEqual(reader[n], steps[n])
+                self.assertEqual(reader[37:53], steps[37:53])
+                self.assertEqual(list(reader.iter_steps(63)), steps[63:])
+                self.assertIsNone(reader.source)
+                with self.assertRaises(IndexError):
+                    reader[100]
+
+    def test_empty_trace(self):
+        self.assertEqual(decode_trace(encode_trace([])), ([], None))
+
+    def test_keyframe_interval_range(self):
+        for interval in (0, 0x10000):
+            with self.assertRaises(ValueError):
+                encode_trace([], keyframe_interval=interval)
+
+    def test_rejects_foreign_data(self):
+        with self.assertRaises(ValueError):
+            TraceReader.from_bytes(b'NOPE' + bytes(40))
+
+    def test_rejects_truncated_data(self):
+        data = encode_trace(make_steps(30), keyframe_interval=8)
+        with self.assertRaises(ValueError):
+            TraceReader.from_bytes(data[:-20])
+
+    def test_rejects_zero_keyframe_interval(self):
+        data = bytearray(encode_trace(make_steps(5)))
+        struct.pack_into('<H', data, 6, 0)
+        with self.assertRaises(ValueError):
+            TraceReader.from_bytes(bytes(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,405 @@
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from itertools import islice
+
+# Binary trace layout (all integers little-endian):
+#
+#   header        MAGIC, version, keyframe interval, step count, string count,
+#                 source string id (0 = none, else id + 1), string index
+#                 offset, step index offset
+#   string data   UTF-8 bytes of every interned string, back to back
+#   step data     one record per step (see _Encoder.step)
+#   string index  string_count + 1 uint64 offsets into the string data
+#   step index    step_count uint64 offsets into the step data
+#
+# Every keyframe_interval-th step is a keyframe holding all variables; the
+# steps in between only hold the variables that changed or disappeared since
+# the previous step. Seeking to step N decodes at most one keyframe plus
+# keyframe_interval - 1 deltas.
+
+MAGIC = b'PPTR'
+VERSION = 1
+DEFAULT_KEYFRAME_INTERVAL = 64
+MAX_KEYFRAME_INTERVAL = 0xFFFF
+
+_HEADER = struct.Struct('<4sHHIIIQQ')
+_OFFSET = struct.Struct('<Q')
+_FLOAT = struct.Struct('<d')
+
+_KEYFRAME = 0x01
+
+_NONE = 0
+_FALSE = 1
+_TRUE = 2
+_INT = 3
+_FLOAT_VALUE = 4
+_STRING = 5
+_LIST = 6
+_INT_ARRAY = 7
+_FLOAT_ARRAY = 8
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+
+def diff_variables(previous, current):
+    """Return (changed, removed) between two variable snapshots."""
+    changed = {name: var for name, var in current.items()
+               if name not in previous or previous[name] != var}
+    removed = [name for name in previous if name not in current]
+    return changed, removed
+
+
+def _typed_array_bytes(typecode, values):
+    values = array(typecode, values)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _write_varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+class _StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def intern(self, value):
+        if value not in self.ids:
+            self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return self.ids[value]
+
+    def optional(self, value):
+        return 0 if value is None else self.intern(value) + 1
+
+
+class _Encoder:
+    def __init__(self, strings):
+        self.strings = strings
+
+    def value(self, out, value):
+        if value is None:
+            out.append(_NONE)
+        elif isinstance(value, bool):
+            out.append(_TRUE if value else _FALSE)
+        elif isinstance(value, int):
+            out.append(_INT)
+            _write_varint(out, _zigzag(value))
+        elif isinstance(value, float):
+            out.append(_FLOAT_VALUE)
+            out += _FLOAT.pack(value)
+        elif isinstance(value, str):
+            out.append(_STRING)
+            _write_varint(out, self.strings.intern(value))
+        elif isinstance(value, list):
+            self.list(out, value)
+        else:
+            raise ValueError(f"Cannot serialize value of type {type(value).__name__}")
+
+    def list(self, out, values):
+        if values and all(type(v) is int and _INT64_MIN <= v <= _INT64_MAX for v in values):
+            out.append(_INT_ARRAY)
+            _write_varint(out, len(values))
+            out += _typed_array_bytes('q', values)
+        elif values and all(type(v) is float for v in values):
+            out.append(_FLOAT_ARRAY)
+            _write_varint(out, len(values))
+            out += _typed_array_bytes('d', values)
+        else:
+            out.append(_LIST)
+            _write_varint(out, len(values))
+            for v in values:
+                self.value(out, v)
+
+    def step(self, out, step, previous):
+        keyframe = previous is None
+        variables = step.get('variables') or {}
+        if keyframe:
+            changed, removed = variables, []
+        else:
+            changed, removed = diff_variables(previous, variables)
+
+        out.append(_KEYFRAME if keyframe else 0)
+        _write_varint(out, self.strings.optional(step.get('line')))
+        _write_varint(out, self.strings.optional(step.get('output')))
+        _write_varint(out, self.strings.optional(step.get('error')))
+        _write_varint(out, len(changed))
+        for name, var in changed.items():
+            _write_varint(out, self.strings.intern(name))
+            _write_varint(out, self.strings.optional(var.get('type')))
+            self.value(out, var.get('value'))
+        _write_varint(out, len(removed))
+        for name in removed:
+            _write_varint(out, self.strings.intern(name))
+
+
+def encode_trace(steps, source=None, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+    """Encode execution steps (and optionally the program source) to bytes."""
+    if not 1 <= keyframe_interval <= MAX_KEYFRAME_INTERVAL:
+        raise ValueError(f"keyframe_interval must be between 1 and {MAX_KEYFRAME_INTERVAL}")
+
+    strings = _StringTable()
+    encoder = _Encoder(strings)
+    source_id = strings.optional(source)
+
+    step_data = bytearray()
+    step_offsets = []
+    previous = None
+    for n, step in enumerate(steps):
+        step_offsets.append(len(step_data))
+        encoder.step(step_data, step, None if n % keyframe_interval == 0 else previous)
+        previous = step.get('variables') or {}
+
+    string_data = bytearray()
+    string_offsets = [0]
+    for s in strings.strings:
+        string_data += s.encode('utf-8')
+        string_offsets.append(len(string_data))
+
+    string_data_offset = _HEADER.size
+    step_data_offset = string_data_offset + len(string_data)
+    string_index_offset = step_data_offset + len(step_data)
+    step_index_offset = string_index_offset + _OFFSET.size * len(string_offsets)
+
+    out = bytearray(_HEADER.pack(MAGIC, VERSION, keyframe_interval, len(step_offsets),
+                                 len(strings.strings), source_id,
+                                 string_index_offset, step_index_offset))
+    out += string_data
+    out += step_data
+    for offset in string_offsets:
+        out += _OFFSET.pack(string_data_offset + offset)
+    for offset in step_offsets:
+        out += _OFFSET.pack(step_data_offset + offset)
+    return bytes(out)
+
+
+def write_trace(path, steps, source=None, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+    """Write a trace file. The file is replaced atomically so open readers are unaffected."""
+    data = encode_trace(steps, source, keyframe_interval)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class TraceReader:
+    """Random-access reader for encoded traces.
+
+    Opening a path memory-maps the file; only the header is read up front.
+    Strings and steps are decoded on demand, so loading a trace or seeking to
+    a step does not deserialize the whole file.
+    """
+    def __init__(self, path=None, data=None):
+        self._file = None
+        self._mmap = None
+        if path is not None:
+            self._file = open(path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._buf = self._mmap
+        elif data is not None:
+            self._buf = memoryview(data)
+        else:
+            raise ValueError("TraceReader needs a path or data")
+
+        if len(self._buf) < _HEADER.size:
+            self.close()
+            raise ValueError("Not a pseudocode trace: file too short")
+        (magic, version, self.keyframe_interval, self.step_count, self.string_count,
+         source_id, self._string_index, self._step_index) = _HEADER.unpack_from(self._buf, 0)
+        problem = self._check_header(magic, version, source_id)
+        if problem:
+            self.close()
+            raise ValueError(problem)
+
+        self._strings = {}
+        self._source_id = source_id
+
+    def _check_header(self, magic, version, source_id):
+        """Return what is wrong with the header, or None. Catches truncated files."""
+        if magic != MAGIC:
+            return "Not a pseudocode trace: bad magic"
+        if version != VERSION:
+            return f"Unsupported trace version: {version}"
+        if self.keyframe_interval < 1:
+            return "Corrupt trace: keyframe interval is 0"
+        if source_id > self.string_count:
+            return "Corrupt trace: source string out of range"
+        size = len(self._buf)
+        string_index_end = self._string_index + (self.string_count + 1) * _OFFSET.size
+        step_index_end = self._step_index + self.step_count * _OFFSET.size
+        if not _HEADER.size <= self._string_index <= string_index_end <= self._step_index <= step_index_end <= size:
+            return "Corrupt trace: string or step index outside the file"
+        return None
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data=data)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.step_count
+
+    @property
+    def source(self):
+        return self._optional_string(self._source_id)
+
+    def string(self, string_id):
+        if string_id not in self._strings:
+            if not 0 <= string_id < self.string_count:
+                raise ValueError(f"String id {string_id} out of range")
+            start, end = struct.unpack_from('<QQ', self._buf, self._string_index + string_id * _OFFSET.size)
+            if not _HEADER.size <= start <= end <= self._string_index:
+                raise ValueError(f"Corrupt trace: string {string_id} outside the string data")
+            self._strings[string_id] = bytes(self._buf[start:end]).decode('utf-8')
+        return self._strings[string_id]
+
+    def _optional_string(self, value):
+        return None if value == 0 else self.string(value - 1)
+
+    def _step_offset(self, n):
+        offset = _OFFSET.unpack_from(self._buf, self._step_index + n * _OFFSET.size)[0]
+        if not _HEADER.size <= offset < self._string_index:
+            raise ValueError(f"Corrupt trace: step {n} outside the step data")
+        return offset
+
+    def _varint(self, pos):
+        result = 0
+        shift = 0
+        while True:
+            byte = self._buf[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return result, pos
+            shift += 7
+
+    def _value(self, pos):
+        tag = self._buf[pos]
+        pos += 1
+        if tag == _NONE:
+            return None, pos
+        if tag == _FALSE:
+            return False, pos
+        if tag == _TRUE:
+            return True, pos
+        if tag == _INT:
+            raw, pos = self._varint(pos)
+            return _unzigzag(raw), pos
+        if tag == _FLOAT_VALUE:
+            return _FLOAT.unpack_from(self._buf, pos)[0], pos + _FLOAT.size
+        if tag == _STRING:
+            string_id, pos = self._varint(pos)
+            return self.string(string_id), pos
+        if tag in (_INT_ARRAY, _FLOAT_ARRAY):
+            count, pos = self._varint(pos)
+            values = array('q' if tag == _INT_ARRAY else 'd')
+            end = pos + count * values.itemsize
+            values.frombytes(self._buf[pos:end])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            return values.tolist(), end
+        if tag == _LIST:
+            count, pos = self._varint(pos)
+            values = []
+            for _ in range(count):
+                value, pos = self._value(pos)
+                values.append(value)
+            return values, pos
+        raise ValueError(f"Unknown value tag {tag} at offset {pos - 1}")
+
+    def _decode_step(self, n, variables):
+        """Decode step n on top of the previous step's variables (updated in place)."""
+        pos = self._step_offset(n)
+        flags = self._buf[pos]
+        pos += 1
+        if flags & _KEYFRAME:
+            variables.clear()
+        line, pos = self._varint(pos)
+        output, pos = self._varint(pos)
+        error, pos = self._varint(pos)
+        changed, pos = self._varint(pos)
+        for _ in range(changed):
+            name, pos = self._varint(pos)
+            type_, pos = self._varint(pos)
+            value, pos = self._value(pos)
+            variables[self.string(name)] = {'value': value, 'type': self._optional_string(type_)}
+        removed, pos = self._varint(pos)
+        for _ in range(removed):
+            name, pos = self._varint(pos)
+            variables.pop(self.string(name), None)
+        return {
+            'line': self._optional_string(line),
+            'variables': dict(variables),
+            'output': self._optional_string(output),
+            'error': self._optional_string(error)
+        }
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            start, stop, stride = n.indices(self.step_count)
+            if stride != 1:
+                raise ValueError("Trace slices do not support a step")
+            return list(islice(self.iter_steps(start), max(stop - start, 0)))
+        if n < 0:
+            n += self.step_count
+        if not 0 <= n < self.step_count:
+            raise IndexError("Step index out of range")
+        variables = {}
+        step = None
+        for i in range(n - n % self.keyframe_interval, n + 1):
+            step = self._decode_step(i, variables)
+        return step
+
+    def iter_steps(self, start=0):
+        variables = {}
+        if start > 0:
+            first = start - start % self.keyframe_interval
+            for i in range(first, start):
+                self._decode_step(i, variables)
+        for i in range(start, self.step_count):
+            yield self._decode_step(i, variables)
+
+    def __iter__(self):
+        return self.iter_steps()
+
+
+def decode_trace(data):
+    """Decode a whole trace from bytes. Returns (steps, source)."""
+    reader = TraceReader.from_bytes(data)
+    return list(reader), reader.source